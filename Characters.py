@@ -8,6 +8,7 @@ import unicodedata
 try:
     import emoji
 except ImportError as ie:
+    emoji = None
     print("emoji module is not installed. Some safeguards against poorly-behaved characters won't be available. Try:\n    pip install emoji")
 
 
@@ -81,6 +82,32 @@ def gen_consume_deque(src_deque):
         yield newItem
     assert False
 
+def bit_reversed(value, bit_count):
+    result = 0
+    for i in range(bit_count):
+        result = (result << 1) | ((value >> i) & 1)
+    return result
+    
+assert [bit_reversed(value, 3) for value in range(8)] == [0, 4, 2, 6, 1, 5, 3, 7]
+
+def gen_stratified(chars, stratum_size=128):
+    """
+    yields chars round-robin from groups of stratum_size consecutive codepoints, so that a prefix of the output samples every part of the unicode range that chars covers. Most unicode blocks start at a multiple of 128.
+    within each group, chars are visited in bit-reversed order of their offset, so that each group is also sampled evenly, instead of from its start.
+    """
+    bitCount = max(0, (stratum_size-1).bit_length())
+    strata = dict()
+    for char in chars:
+        strata.setdefault(ord(char)//stratum_size, []).append(char)
+    stratumDeques = deque(deque(sorted(stratum, key=(lambda char: bit_reversed(ord(char)%stratum_size, bitCount)))) for stratum in strata.values())
+    while len(stratumDeques) > 0:
+        stratumDeque = stratumDeques.popleft()
+        yield stratumDeque.popleft()
+        if len(stratumDeque) > 0:
+            stratumDeques.append(stratumDeque)
+                
+assert "".join(gen_stratified("abc\u0100\u0101\u0200", stratum_size=128)) == "b\u0100\u0200a\u0101c"
+
 def join_upto(src_gen, count, delimiter=""):
     assert count >= 0
     return delimiter.join(gen_take_upto(src_gen, count))
@@ -99,6 +126,82 @@ def diff_compact(str_a, str_b, include_unchanged=False, include_indices=False):
     return result
 
 
+def count_inversions(values):
+    """
+    counts the pairs (i, j) with i < j and values[i] > values[j], by merge sort in O(n log n).
+    """
+    values = list(values)
+    buffer = [None for i in range(len(values))]
+    inversionCount = 0
+    width = 1
+    while width < len(values):
+        for start in range(0, len(values), 2*width):
+            middle, end = min(start+width, len(values)), min(start+2*width, len(values))
+            left, right, out = start, middle, start
+            while left < middle and right < end:
+                if values[right] < values[left]:
+                    inversionCount += middle - left
+                    buffer[out] = values[right]
+                    right += 1
+                else:
+                    buffer[out] = values[left]
+                    left += 1
+                out += 1
+            buffer[out:end] = values[left:middle] + values[right:end]
+        values, buffer = buffer, values
+        width *= 2
+    return inversionCount
+    
+assert count_inversions([]) == 0
+assert count_inversions([0, 1, 2]) == 0
+assert count_inversions([2, 1, 0]) == 3
+assert count_inversions([1, 3, 0, 2, 4]) == 3
+
+
+def get_rank_map(alphabet):
+    result = dict()
+    for rank, char in enumerate(alphabet):
+        if char in result:
+            raise ValueError("alphabet contains {!r} more than once.".format(char))
+        result[char] = rank
+    return result
+
+
+def compare_alphabets(str_a, str_b):
+    """
+    rank-based replacement for diff_compact when comparing alphabets. Both alphabets must not contain any char twice.
+    returns a dict with:
+        "added", "removed" - chars only in str_b, and chars only in str_a.
+        "moved" - (char, displacement) pairs for chars in both alphabets, where displacement is the change in the char's rank among the shared chars.
+        "kendall_tau_distance" - count of shared char pairs that are in different orders, and "kendall_tau_distance_normalized", that count divided by the number of pairs.
+        "spearman_footrule" - sum of the absolute displacements, and "spearman_rho", the rank correlation of the shared chars.
+    """
+    rankMapA, rankMapB = get_rank_map(str_a), get_rank_map(str_b)
+    sharedChars = [char for char in str_a if char in rankMapB]
+    sharedRankMapB = get_rank_map(sorted(sharedChars, key=(lambda char: rankMapB[char])))
+    sharedCount = len(sharedChars)
+    
+    displacements = [(char, sharedRankMapB[char] - sharedRankA) for sharedRankA, char in enumerate(sharedChars)]
+    inversionCount = count_inversions(sharedRankMapB[char] for char in sharedChars)
+    pairCount = sharedCount*(sharedCount-1)//2
+    squareSum = sum(displacement**2 for char, displacement in displacements)
+    
+    result = {
+        "added": [char for char in str_b if char not in rankMapA],
+        "removed": [char for char in str_a if char not in rankMapB],
+        "moved": [(char, displacement) for char, displacement in displacements if displacement != 0],
+        "kendall_tau_distance": inversionCount,
+        "kendall_tau_distance_normalized": (float(inversionCount)/pairCount if pairCount > 0 else 0.0),
+        "spearman_footrule": sum(abs(displacement) for char, displacement in displacements),
+        "spearman_rho": (1.0 - 6.0*squareSum/(sharedCount*(sharedCount**2-1)) if sharedCount > 1 else 1.0),
+    }
+    return result
+    
+assert compare_alphabets("abc", "abc")["kendall_tau_distance"] == 0
+assert compare_alphabets("abcd", "xcba")["kendall_tau_distance"] == 3
+assert compare_alphabets("abcd", "xcba")["removed"] == ["d"]
+
+
 def to_hex_str(value):
     result = deque([])
     while value > 0:
@@ -127,7 +230,7 @@ def char_is_wellbehaved(char):
         return False
     if unicodedata.category(char) in POORLY_BEHAVED_CATEGORIES:
         return False
-    if emoji.emoji_count(char) > 0:
+    if emoji is not None and emoji.emoji_count(char) > 0:
         return False
     if char in SPECIAL_CHAR_SET:
         return False
@@ -235,6 +338,90 @@ def identify_safe_chars(src_list, goods=None, bads=None, width=32, height=24, do
                     goods.add(char)
     print("ending abnormally.")
     return result
+    
+    
+    
+    
+# categories that terminals draw with no width. This describes terminals, while POORLY_BEHAVED_CATEGORIES is the policy for which chars to use.
+ZERO_WIDTH_CATEGORIES = {"Mn", "Me", "Cf"}
+ZERO_WIDTH_ORD_RANGES = [(0x1160, 0x1200), (0x200B, 0x2010), (0x2028, 0x202F), (0x2060, 0x2070), (0xFE00, 0xFE10), (0xFEFF, 0xFF00)]
+
+
+def terminal_cell_width(char, ambiguous_width=1):
+    """
+    model of how many terminal cells a char occupies, similar to wcwidth. returns -1 for chars that have no width because they are control chars.
+    """
+    assert len(char) == 1
+    charCode = ord(char)
+    if charCode < 32 or 0x7F <= charCode < 0xA0:
+        return -1
+    if unicodedata.combining(char) != 0 or unicodedata.category(char) in ZERO_WIDTH_CATEGORIES:
+        return 0
+    if any(rangeStart <= charCode < rangeEnd for rangeStart, rangeEnd in ZERO_WIDTH_ORD_RANGES):
+        return 0
+    eastAsianWidth = unicodedata.east_asian_width(char)
+    if eastAsianWidth in ("W", "F"):
+        return 2
+    if eastAsianWidth == "A":
+        return ambiguous_width
+    return 1
+    
+assert [terminal_cell_width(char) for char in "a\u0301\u4e00\x07"] == [1, 0, 2, -1]
+
+
+def get_rendered_width_screen(font_profile):
+    """
+    returns a function telling whether a char renders at the width of the first keyboard letter in font_profile. font_profile.render_char is expected to raise a ValueError (such as UnusableCharError) for chars it can't use.
+    """
+    expectedWidth = font_profile.render_char(KEYBOARD_LETTERS[0]).get_width()
+    def renderedWidthIsExpected(char):
+        try:
+            return font_profile.render_char(char).get_width() == expectedWidth
+        except ValueError:
+            return False
+    return renderedWidthIsExpected
+    
+    
+def identify_safe_chars_automatically(src_list, goods=None, bads=None, font_profile=None, reject_ambiguous_width=True):
+    """
+    automatic batch version of identify_safe_chars. Chars must pass char_is_wellbehaved, then are screened by the terminal cell width model (combining class and east asian width), and optionally by their rendered width in font_profile.
+    returns a dict in the same shape as identify_safe_chars. Chars that are only suspicious because their east asian width is ambiguous go to "recycle" instead of "bads" when reject_ambiguous_width is False, so that they can be reviewed with identify_safe_chars.
+    """
+    if goods is None:
+        goods = set()
+    if bads is None:
+        bads = set()
+    assert isinstance(goods, set)
+    assert isinstance(bads, set)
+    recycleDeque = deque([])
+    result = {"goods":goods, "bads":bads, "recycle":recycleDeque}
+    renderedWidthIsExpected = None if font_profile is None else get_rendered_width_screen(font_profile)
+    
+    for char in src_list:
+        assert len(char) == 1
+        if char in goods or char in bads:
+            continue
+        if not char_is_wellbehaved(char):
+            bads.add(char)
+            continue
+        if terminal_cell_width(char, ambiguous_width=2) != 1:
+            if terminal_cell_width(char, ambiguous_width=1) != 1 or reject_ambiguous_width:
+                bads.add(char)
+                continue
+            recycleDeque.append(char)
+            continue
+        if renderedWidthIsExpected is not None and not renderedWidthIsExpected(char):
+            bads.add(char)
+            continue
+        goods.add(char)
+    return result
+    
+    
+def screen_codepoint_range(start, stop, **kwargs):
+    """
+    screens every codepoint in range(start, stop) with identify_safe_chars_automatically.
+    """
+    return identify_safe_chars_automatically((chr(charCode) for charCode in range(start, stop)), **kwargs)
             
 
 
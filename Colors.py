@@ -28,4 +28,63 @@ def get_surface_absolute_luminosity_float(surface):
 def get_surface_relative_luminosity_float(surface):
     abs_lum_int = get_surface_absolute_luminosity_int(surface)
     area = surface.get_height() * surface.get_width()
-    return luminosity_int_to_float(float(abs_lum_int)/float(area))
\ No newline at end of file
+    return luminosity_int_to_float(float(abs_lum_int)/float(area))
+    
+    
+def get_coverage_float(absolute_luminosity_int, area, color, background):
+    """
+    the fraction of a two-colored surface covered by color, where a pixel halfway between background and color counts as half covered. returns None if color and background have the same luminosity.
+    """
+    colorLuminosity, backgroundLuminosity = get_color_luminosity_int(color), get_color_luminosity_int(background)
+    if colorLuminosity == backgroundLuminosity:
+        return None
+    return float(absolute_luminosity_int - area*backgroundLuminosity) / float(area*(colorLuminosity - backgroundLuminosity))
+    
+def get_absolute_luminosity_int_from_coverage(coverage, area, color, background):
+    colorLuminosity, backgroundLuminosity = get_color_luminosity_int(color), get_color_luminosity_int(background)
+    return int(round(area*(backgroundLuminosity + coverage*(colorLuminosity - backgroundLuminosity))))
+    
+    
+def get_sampling_stride(surface, sample_count):
+    # the largest power of 2 stride that samples at least sample_count pixels of surface. Halving it refines a sample without moving any of its pixels.
+    area = surface.get_height() * surface.get_width()
+    stride = 1
+    while float(area)/(2*stride)**2 >= sample_count:
+        stride *= 2
+    return stride
+    
+def sample_surface_luminosity_ints(surface, stride, coarser_stride=None):
+    """
+    the luminosity of each pixel of surface whose x and y are both multiples of stride.
+    coarser_stride - a multiple of stride. Pixels that a sample at coarser_stride already holds are skipped, so that a sample can be refined without reading any pixel twice.
+    """
+    width, height = surface.get_width(), surface.get_height()
+    return [get_color_luminosity_int(surface.get_at((x,y))) for y in range(0, height, stride) for x in range(0, width, stride) if coarser_stride is None or x % coarser_stride != 0 or y % coarser_stride != 0]
+    
+def estimate_absolute_luminosity_int_from_sample(sample, area, confidence_z=4.0):
+    """
+    estimate the absolute luminosity int of a surface of area pixels from a sample of its pixel luminosities, such as the output of sample_surface_luminosity_ints.
+    returns (estimate, error bound). The bound is statistical: confidence_z standard errors of the sample mean, plus the luminosity of one full pixel, so that it is never 0 for a partial sample. It is 0 when the sample holds every pixel.
+    """
+    sampleCount = len(sample)
+    if sampleCount >= area:
+        return (sum(sample), 0.0)
+    fullPixelLuminosity = get_color_luminosity_int((255,255,255))
+    if sampleCount < 2:
+        # no variance to go by, so anything is possible.
+        return (area*fullPixelLuminosity/2.0, area*fullPixelLuminosity/2.0)
+    sampleMean = float(sum(sample)) / sampleCount
+    sampleVariance = sum((value-sampleMean)**2 for value in sample) / (sampleCount-1)
+    finitePopulationCorrection = 1.0 - float(sampleCount)/area
+    standardError = (sampleVariance / sampleCount * finitePopulationCorrection)**0.5
+    perPixelBound = confidence_z*standardError + fullPixelLuminosity/float(area)
+    return (sampleMean*area, perPixelBound*area)
+    
+def estimate_surface_absolute_luminosity_int(surface, stride, confidence_z=4.0):
+    """
+    estimate get_surface_absolute_luminosity_int(surface) from the pixels whose x and y are both multiples of stride.
+    returns (estimate, error bound, count of pixels sampled). See estimate_absolute_luminosity_int_from_sample.
+    """
+    sample = sample_surface_luminosity_ints(surface, stride)
+    estimate, bound = estimate_absolute_luminosity_int_from_sample(sample, surface.get_width()*surface.get_height(), confidence_z=confidence_z)
+    return (estimate, bound, len(sample))
@@ -1,3 +1,6 @@
+import struct
+import zlib
+
 import pygame
 
 
@@ -65,4 +68,53 @@ def join_surfaces_vertically(surfaces, **kwargs):
     result = join_surfaces_horizontally(surfacesToUse, **kwargs)
     result = mirror_over_negative_diagonal(result)
     return result
-    
\ No newline at end of file
+    
+
+
+
+
+def png_chunk_bytes(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+
+class PNGStreamWriter:
+    """
+    writes an RGBA PNG of a known size from horizontal strips, so that the whole image is never held in memory.
+    """
+    def __init__(self, path, width, height, compression_level=6):
+        assert width > 0 and height > 0
+        self.width, self.height = (width, height)
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compression_level)
+        self._file = open(path, "wb")
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        self._file.write(png_chunk_bytes(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+        
+    def _write_idat(self, data):
+        if len(data) > 0:
+            self._file.write(png_chunk_bytes(b"IDAT", data))
+        
+    def write_surface_rows(self, surface):
+        assert surface.get_width() == self.width, f"strip width {surface.get_width()} does not match image width {self.width}."
+        assert self.rows_written + surface.get_height() <= self.height, "too many rows."
+        pixelBytes = pygame.image.tobytes(surface, "RGBA")
+        rowLength = self.width*4
+        for y in range(surface.get_height()):
+            # each row starts with filter type 0, meaning unfiltered.
+            self._write_idat(self._compressor.compress(b"\x00" + pixelBytes[y*rowLength:(y+1)*rowLength]))
+        self.rows_written += surface.get_height()
+        
+    def close(self):
+        assert self.rows_written == self.height, f"only {self.rows_written} of {self.height} rows were written."
+        self._write_idat(self._compressor.flush())
+        self._file.write(png_chunk_bytes(b"IEND", b""))
+        self._file.close()
@@ -7,25 +7,39 @@ PyLuminosityAlphabet.py by John Dorsey.
 
 
 
+import hashlib
 import pathlib
 from collections import namedtuple
 import itertools
+import json
+import random
 import time
-from typing import Iterable, Iterator, List, NoReturn
+from typing import Dict, Iterable, Iterator, List, NoReturn, Tuple
 
 
 import pygame
 pygame.init()
 
+try:
+    import numpy
+except ImportError as ie:
+    numpy = None
+    print("numpy module is not installed. Multi-size luminosity estimates won't be available. Try:\n    pip install numpy")
+
 import Characters
 from Characters import gen_chunks_as_lists
-from Colors import get_surface_absolute_luminosity_int, get_surface_relative_luminosity_float
+from Colors import get_surface_absolute_luminosity_int, get_surface_relative_luminosity_float, get_coverage_float, get_absolute_luminosity_int_from_coverage, luminosity_int_to_float, get_color_luminosity_int, get_sampling_stride, sample_surface_luminosity_ints, estimate_absolute_luminosity_int_from_sample
 import Graphics
 
 
 
 DEFAULT_FONT_PATH_STR = "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf"
 
+# private use codepoints that fonts are not expected to map, used to draw a font's .notdef (missing glyph) box. A font may map any one of them, but a picture that several of them share can only be the .notdef box.
+NOTDEF_PROBE_CHARS = "\U0010FFFD\U000FFFFD\uF8FE\uE000"
+# FULL BLOCK, the densest char most fonts can draw. It is the brightest char for light text on a dark background, and the darkest for dark text on a light one.
+DENSE_PROBE_CHAR = "\u2588"
+
 def stall_pygame():
     running = True
     while running:
@@ -74,6 +88,10 @@ def surface_to_tuple_list_list(surf):
             result.append(currentTuple)
     return result
     
+def surface_digest(surf):
+    # a compact stand-in for surface_to_tuple_list_list when only equality matters.
+    return hashlib.sha1(pygame.image.tobytes(surf, "RGBA")).hexdigest()
+    
 def iter_flatly(data):
     for item in data:
         if hasattr(item, "__iter__"):
@@ -100,7 +118,7 @@ class HashableList(list):
     def __repr__(self):
         return "HashableList({})".format(list.__repr__(self))
 
-TextElement = namedtuple("TextElement",["font_name", "font_size", "antialias", "text", "image", "image_width", "image_height", "absolute_luminosity", "relative_luminosity"])
+TextElement = namedtuple("TextElement",["font_name", "font_size", "antialias", "text", "image", "image_width", "image_height", "absolute_luminosity", "relative_luminosity", "coverage"], defaults=[None])
 
 
 
@@ -155,6 +173,9 @@ class ValidationFailure(ValueError):
 class UnusableCharError(ValueError):
     pass
     
+class NotdefCharError(UnusableCharError):
+    pass
+    
     
 def validate_metrics(font, char) -> NoReturn:
     # verify that the character is not negative-width, and that its advance and offset are equal (it is not weird). 
@@ -162,6 +183,9 @@ def validate_metrics(font, char) -> NoReturn:
     assert len(char) == 1
     charCode = ord(char)
     charMetrics = font.metrics(char)[0]
+    # pygame has no metrics for codepoints outside the Basic Multilingual Plane. Unmapped codepoints inside it get the metrics of the .notdef glyph, so this is not a test of whether the font maps char.
+    if charMetrics is None:
+        raise ValidationFailure("char code {}: pygame has no metrics for it.".format(charCode))
     if min(charMetrics) < 0:
         raise ValidationFailure("char code {}, metrics {}: had negative value.".format(charCode, charMetrics))
     if charMetrics[1] != charMetrics[-1]:
@@ -179,14 +203,41 @@ class FullFont:
     
     def render_char(self, char):
         assert len(char) == 1
-        return self.pygame_font.render(char, self.antialias, self.color, self.background)
+        try:
+            return self.pygame_font.render(char, self.antialias, self.color, self.background)
+        except (pygame.error, ValueError) as e:
+            # such as null chars, and zero width chars like combining marks.
+            raise UnusableCharError("char code {} can't be rendered: {}".format(ord(char), e))
     
     def metrics(self, text):
         return self.pygame_font.metrics(text)
         
-    def char_to_element(self, char) -> TextElement:
+    def get_notdef_probe_char(self):
+        """
+        returns a char of NOTDEF_PROBE_CHARS that is drawn as the .notdef glyph, or None if no two of them are drawn alike.
+        """
+        charsByDigest = dict()
+        for char in NOTDEF_PROBE_CHARS:
+            try:
+                charsByDigest.setdefault(surface_digest(self.render_char(char)), []).append(char)
+            except UnusableCharError:
+                continue
+        sharedChars = max(charsByDigest.values(), key=len, default=[])
+        return sharedChars[0] if len(sharedChars) >= 2 else None
+        
+    def render_element_image(self, char):
+        # the picture that char_to_element measures.
+        return self.render_char(char)
+        
+    def char_to_element(self, char, reject_image_fun=None) -> TextElement:
+        """
+        reject_image_fun - if set, it is called with the rendered picture before any luminosity is computed, and may raise UnusableCharError to skip the char.
+        """
         assert len(char) == 1
-        picture = self.render_char(char)
+        picture = self.render_element_image(char)
+        if reject_image_fun is not None:
+            reject_image_fun(picture)
+        absoluteLuminosity = get_surface_absolute_luminosity_int(picture)
         result = TextElement(
             self.name,
             self.size,
@@ -195,8 +246,9 @@ class FullFont:
             picture,
             picture.get_width(),
             picture.get_height(),
-            get_surface_absolute_luminosity_int(picture),
+            absoluteLuminosity,
             get_surface_relative_luminosity_float(picture),
+            get_coverage_float(absoluteLuminosity, picture.get_width()*picture.get_height(), self.color, self.background),
         ) 
         return result
 
@@ -245,6 +297,20 @@ class MonospaceFont(FullFont):
             return result
         
         
+    def render_line(self, text):
+        """
+        render text with a single call, raising UnusableCharError if the result is not exactly monospace width per char.
+        """
+        try:
+            result = self.full_font.pygame_font.render(text, self.full_font.antialias, self.full_font.color, self.full_font.background)
+        except (pygame.error, ValueError) as e:
+            # such as null chars and lone surrogates, which the per-char path replaces with error chars.
+            raise UnusableCharError("line can't be rendered: {}".format(e))
+        if result.get_width() != len(text) * self.monospace_width:
+            raise UnusableCharError()
+        return result
+        
+        
     def render_error_char(self):
         template = self.render_char(self.test_chars[0])
         for y in range(template.get_height()):
@@ -257,38 +323,151 @@ class MonospaceFont(FullFont):
 
         
         
-def filtered_for_uniform_density(src_gen, key_fun, segment_count):
+def uniformity_score(key0, key1, key2):
+    assert key0 <= key1 <= key2
+    dists = [key1-key0, key2-key1]
+    if 0 in dists:
+        return 0
+    return min(dists)/max(dists)
+    
+def uniformity_score_bounds(bounds0, bounds1, bounds2):
+    """
+    the lowest and highest uniformity_score of any keys within the (low, high) bounds given for each key, such as luminosity estimates with error bounds.
+    """
+    lowDists = [max(bounds1[0]-bounds0[1], 0.0), max(bounds2[0]-bounds1[1], 0.0)]
+    highDists = [max(bounds1[1]-bounds0[0], 0.0), max(bounds2[1]-bounds1[0], 0.0)]
+    if 0 in highDists:
+        return (0, 0)
+    lowScore = 0 if 0 in lowDists else min(lowDists[0]/highDists[1], lowDists[1]/highDists[0])
+    if lowDists[0] > highDists[1]:
+        highScore = highDists[1]/lowDists[0]
+    elif lowDists[1] > highDists[0]:
+        highScore = highDists[0]/lowDists[1]
+    else:
+        highScore = 1.0
+    return (lowScore, highScore)
+    
+assert uniformity_score_bounds((0,0), (1,1), (3,3)) == (0.5, 0.5)
+assert uniformity_score_bounds((0,0), (1,2), (3,3)) == (0.5, 1.0)
+    
+    
+class UniformDensityFilter:
+    """
+    keeps a maximum of one item per segment of the space between 0.0 inclusive and 1.0 exclusive, preferring items that are evenly spaced between their neighbors. Items can be added a few at a time.
+    """
     ResultEntry = namedtuple("ResultEntry", ["rawKey", "value"])
-    def uniformityScore(key0, key1, key2):
-        assert key0 <= key1 <= key2
-        dists = [key1-key0, key2-key1]
-        if 0 in dists:
-            return 0
-        return min(dists)/max(dists)
-    result = [None for i in range(segment_count)]
-    for i,item in enumerate(src_gen):
-        itemRawKey = key_fun(item)
-        assert 0 <= itemRawKey < 1, "bad key_fun output for {} at src_gen index {}.".format(item,i)
-        itemSegIndex = int(round(itemRawKey * segment_count))
+    
+    def __init__(self, key_fun, segment_count):
+        self.key_fun = key_fun
+        self.segment_count = segment_count
+        self.result = [None for i in range(segment_count)]
+        self.item_count = 0
+        
+    def add(self, item):
+        result, segment_count = self.result, self.segment_count
+        itemRawKey = self.key_fun(item)
+        assert 0 <= itemRawKey < 1, "bad key_fun output for {} at src_gen index {}.".format(item,self.item_count)
+        self.item_count += 1
+        # keys just below 1.0, such as the background of a dark-on-light font, would round to segment_count.
+        itemSegIndex = min(int(round(itemRawKey * segment_count)), segment_count-1)
         assert 0 <= itemSegIndex < segment_count
-        newEntry = ResultEntry(itemRawKey, item)
+        newEntry = UniformDensityFilter.ResultEntry(itemRawKey, item)
         oldEntry = result[itemSegIndex] 
         if oldEntry is not None:
             leftRawKey = result[itemSegIndex-1].rawKey if (itemSegIndex-1 >= 0 and result[itemSegIndex-1] is not None) else 0.0
             rightRawKey = result[itemSegIndex+1].rawKey if (itemSegIndex+1 < segment_count and result[itemSegIndex+1] is not None) else 1.0
-            oldUniformity = uniformityScore(leftRawKey, oldEntry.rawKey, rightRawKey)
-            newUniformity = uniformityScore(leftRawKey, newEntry.rawKey, rightRawKey)
+            oldUniformity = uniformity_score(leftRawKey, oldEntry.rawKey, rightRawKey)
+            newUniformity = uniformity_score(leftRawKey, newEntry.rawKey, rightRawKey)
             if newUniformity > oldUniformity:
                 result[itemSegIndex] = newEntry
         else:
             result[itemSegIndex] = newEntry
-    return [item.value for item in result if item is not None]
+            
+    def is_filled(self, tolerance, seen_range_only=False):
+        """
+        whether every segment has an item, and every item between two others has a uniformity_score of at least 1-tolerance.
+        seen_range_only - only check the segments between the lowest and highest filled segments, for when some segments can't ever be filled.
+        """
+        segIndices = range(self.segment_count)
+        if seen_range_only:
+            filledRange = self.get_filled_range()
+            if filledRange is None:
+                return False
+            segIndices = range(filledRange[0], filledRange[1]+1)
+        if any(self.result[segIndex] is None for segIndex in segIndices):
+            return False
+        for segIndex in segIndices[1:-1]:
+            if uniformity_score(self.result[segIndex-1].rawKey, self.result[segIndex].rawKey, self.result[segIndex+1].rawKey) < 1.0-tolerance:
+                return False
+        return True
+        
+    def get_filled_range(self):
+        # (lowest, highest) filled segment indices, or None if no segment is filled.
+        filledSegIndices = [segIndex for segIndex, entry in enumerate(self.result) if entry is not None]
+        if len(filledSegIndices) == 0:
+            return None
+        return (filledSegIndices[0], filledSegIndices[-1])
+        
+    def get_values(self):
+        return [item.value for item in self.result if item is not None]
+        
+        
+def filtered_for_uniform_density(src_gen, key_fun, segment_count):
+    densityFilter = UniformDensityFilter(key_fun, segment_count)
+    for item in src_gen:
+        densityFilter.add(item)
+    return densityFilter.get_values()
     
 
 
 
         
         
+def select_alphabet_elements(elements, max_segment_count=None) -> List[TextElement]:
+    if max_segment_count is not None:
+        result = filtered_for_uniform_density(elements, (lambda inputElem: inputElem.relative_luminosity), max_segment_count)
+    else:
+        result = [item for item in elements]
+    result.sort(key=(lambda item: item.absolute_luminosity))
+    return result
+    
+    
+def recolored_element(elem, color, background) -> TextElement:
+    """
+    derive the luminosity an element would have if it were rendered in other colors, from its coverage. The result has no image.
+    """
+    if elem.coverage is None:
+        raise ValueError("elem has no coverage to recolor with. It may have been rendered with color and background of equal luminosity.")
+    area = elem.image_width * elem.image_height
+    absoluteLuminosity = get_absolute_luminosity_int_from_coverage(elem.coverage, area, color, background)
+    return elem._replace(
+        image=None,
+        absolute_luminosity=absoluteLuminosity,
+        relative_luminosity=luminosity_int_to_float(float(absoluteLuminosity)/float(area)),
+    )
+
+
+
+
+def get_area_weights(src_length, dst_length, scale):
+    """
+    when src pixel i covers [i*scale, (i+1)*scale) in dst pixels, this is the length of each src pixel that lands inside [0, dst_length). Summing src values with these weights sums their area-downsampled dst values.
+    """
+    srcStarts = numpy.arange(src_length) * scale
+    return numpy.clip(numpy.minimum(srcStarts + scale, dst_length) - srcStarts, 0.0, None)
+    
+    
+def get_coverage_stack(surfaces, color, background):
+    """
+    per-pixel coverage of two-colored surfaces of equal size, indexed [surface, y, x].
+    """
+    colorLuminosity, backgroundLuminosity = get_color_luminosity_int(color), get_color_luminosity_int(background)
+    luminosityStack = numpy.stack([pygame.surfarray.array3d(surface) for surface in surfaces]).sum(axis=3, dtype=numpy.int64).transpose(0, 2, 1)
+    return (luminosityStack - backgroundLuminosity) / float(colorLuminosity - backgroundLuminosity)
+
+
+
+
 def deal_cards_to_hands(deck, hands):
     for handToModify, cardToAdd in itertools.zip_longest(itertools.cycle(hands), deck):
         if cardToAdd is None:
@@ -336,7 +515,7 @@ class BadDrawError(ValueError):
     
 
 class FontProfile:
-    def __init__(self, name, size, antialias=True, force_monospace=True, screen_metrics=False, test_chars=Characters.KEYBOARD_CHARS):
+    def __init__(self, name, size, antialias=True, force_monospace=True, screen_metrics=False, test_chars=Characters.KEYBOARD_CHARS, color=(255,255,255), background=(0,0,0)):
         if name is None:
             name = DEFAULT_FONT_PATH_STR
         self._name, self._size = name, size
@@ -344,15 +523,60 @@ class FontProfile:
         self._force_monospace = force_monospace
         self._screen_metrics = screen_metrics
         
-        fullFont = FullFont(name, size, antialias)
+        self._color, self._background = color, background
+        self._test_chars = test_chars
+        
+        fullFont = FullFont(name, size, antialias, color=color, background=background)
         if self._force_monospace:
             self.font = MonospaceFont(fullFont, test_chars=test_chars)
         else:
             self.font = fullFont
+            
+        self.notdef_rejection_count = 0
+        self._notdef_element, self._notdef_digest = self._get_notdef_element_and_digest()
+        
+        
+    def _get_notdef_element_and_digest(self):
+        probeChar = self.font.get_notdef_probe_char()
+        if probeChar is None:
+            print("FontProfile._get_notdef_element_and_digest: no two probe chars are drawn alike in {}, so .notdef glyphs can't be detected.".format(self._name))
+            return (None, None)
+        try:
+            notdefElement = self.font.char_to_element(probeChar)
+        except UnusableCharError:
+            return (None, None) # .notdef glyphs are already rejected for their width.
+        if notdefElement.coverage == 0:
+            return (None, None) # an empty .notdef glyph can't be told apart from spaces.
+        return (notdefElement, surface_digest(notdefElement.image))
+        
+        
+    def is_notdef_element(self, elem, luminosity_bound=0) -> bool:
+        """
+        whether elem looks exactly like this font's .notdef glyph. Pixels are only compared when the cheaper luminosity and size checks match.
+        luminosity_bound - the error bound of elem.absolute_luminosity, if it is an estimate.
+        """
+        notdefElement = self._notdef_element
+        if notdefElement is None:
+            return False
+        if abs(elem.absolute_luminosity - notdefElement.absolute_luminosity) > luminosity_bound:
+            return False
+        return self.is_notdef_image(elem.image)
+        
+        
+    def is_notdef_image(self, picture) -> bool:
+        # the size is compared first, since it rules out most glyphs of proportional fonts without reading any pixels.
+        if self._notdef_element is None or picture.get_size() != self._notdef_element.image.get_size():
+            return False
+        return surface_digest(picture) == self._notdef_digest
+        
+        
+    def _reject_notdef_image(self, picture) -> NoReturn:
+        if self.is_notdef_image(picture):
+            raise NotdefCharError("matches the .notdef glyph.")
         
         
     def __repr__(self):
-        return "FontProfile(name={}, size={}, antialias={}, force_monospace={}, screen_metrics={})".format(self._name, self._size, self._antialias, self._force_monospace, self._screen_metrics)
+        return "FontProfile(name={}, size={}, antialias={}, force_monospace={}, screen_metrics={}, color={}, background={})".format(self._name, self._size, self._antialias, self._force_monospace, self._screen_metrics, self._color, self._background)
         
         
     def render_char(self, char) -> pygame.Surface:
@@ -369,6 +593,15 @@ class FontProfile:
         
     def render_line(self, text) -> pygame.Surface:
         assert "\n" not in text
+        if isinstance(self.font, MonospaceFont):
+            # fast path: one render call for the whole line, which is only trusted if its width proves every char was monospace.
+            try:
+                if self._screen_metrics:
+                    for char in text:
+                        validate_metrics(self.font, char)
+                return self.font.render_line(text)
+            except (ValidationFailure, UnusableCharError):
+                pass
         surfacesToCombine = []
         for char in text:
             try:
@@ -386,19 +619,57 @@ class FontProfile:
         return outputSurface
         
         
-    def char_to_element(self, char) -> TextElement:
-        return self.font.char_to_element(char)
+    def _char_to_unmeasured_element(self, char, reject_notdef=False) -> TextElement:
+        # like char_to_element, but without summing any luminosity, for callers that only need the picture.
+        picture = self.font.render_element_image(char)
+        if reject_notdef:
+            self._reject_notdef_image(picture)
+        return TextElement(self._name, self._size, self._antialias, char, picture, picture.get_width(), picture.get_height(), None, None, None)
+        
+        
+    def char_to_element(self, char, reject_notdef=False) -> TextElement:
+        """
+        reject_notdef - raise NotdefCharError if the char is drawn as the font's .notdef box. This is checked before the luminosity is computed.
+        """
+        return self.font.char_to_element(char, reject_image_fun=(self._reject_notdef_image if reject_notdef else None))
 
             
-    def _gen_elements(self, include=Characters.KEYBOARD_CHARS, exclude=Characters.SPECIAL_CHAR_SET) -> Iterator[TextElement]:
+    def _gen_positioned_elements(self, include=Characters.KEYBOARD_CHARS, exclude=Characters.SPECIAL_CHAR_SET, shard_index=0, shard_count=1, reject_notdef=True, element_fun=None) -> Iterator[Tuple[int, TextElement]]:
         """
-        include may be a generator. exclude should be a set for best performance.
+        yields (position, element) pairs, where position is the index of the element's char among the chars of include that are not in exclude.
+        shard_index, shard_count - if set, only chars whose position is shard_index modulo shard_count are processed.
+        reject_notdef - skip chars that the font draws as its .notdef box. self.notdef_rejection_count is reset for each scan, and counts them.
+        element_fun - used instead of self.char_to_element. It may raise UnusableCharError to skip a char, or NotdefCharError to skip and count it.
         """
-        for char in iter_include_exclude(include, exclude):
+        assert 0 <= shard_index < shard_count
+        if element_fun is None:
+            element_fun = (lambda char: self.char_to_element(char, reject_notdef=reject_notdef))
+        elif reject_notdef:
+            customElementFun = element_fun
+            def element_fun(char):
+                newElement = customElementFun(char)
+                if self.is_notdef_element(newElement):
+                    raise NotdefCharError("matches the .notdef glyph.")
+                return newElement
+        self.notdef_rejection_count = 0
+        for position, char in enumerate(iter_include_exclude(include, exclude)):
+            if position % shard_count != shard_index:
+                continue
             try:
-                newElement = self.char_to_element(char)
+                newElement = element_fun(char)
+            except NotdefCharError:
+                self.notdef_rejection_count += 1
+                continue
             except UnusableCharError:
                 continue
+            yield (position, newElement)
+            
+            
+    def _gen_elements(self, include=Characters.KEYBOARD_CHARS, exclude=Characters.SPECIAL_CHAR_SET, **position_kwargs) -> Iterator[TextElement]:
+        """
+        include may be a generator. exclude should be a set for best performance.
+        """
+        for position, newElement in self._gen_positioned_elements(include=include, exclude=exclude, **position_kwargs):
             yield newElement
             
             
@@ -420,19 +691,273 @@ class FontProfile:
         max_segment_count - if set, this filters elements for uniform density, dividing the space between 0.0 inclusive and 1.0 exclusive into segments and keeping a maximum of one character per segment. Good for reducing memory usage when processing thousands or millions of characters.
         """
         elemGen = self.gen_elements(**other_kwargs)
+        return select_alphabet_elements(elemGen, max_segment_count=max_segment_count)
+        
+        
+    def _get_dense_probe_seg_index(self, segment_count):
+        # the segment of the densest char the font can draw, which no other char should be further from the background than.
+        try:
+            probeElement = self.char_to_element(DENSE_PROBE_CHAR, reject_notdef=True)
+        except UnusableCharError:
+            return None
+        return min(int(round(probeElement.relative_luminosity * segment_count)), segment_count-1)
+        
+        
+    def gen_progressive_alphabet_elements(self, max_segment_count, batch_size=64, tolerance=0.25, seen_range_only=True, patience=None, time_budget=None, include=Characters.KEYBOARD_CHARS, stratum_size=128, **other_kwargs) -> Iterator[List[TextElement]]:
+        """
+        An "anytime" version of get_alphabet_elements. Candidates are visited in an order that is spread across the unicode blocks of include, and a snapshot of the alphabet found so far is yielded after every batch_size elements.
+        Stops early once every segment holds a character that is evenly spaced between its neighbors within tolerance (see UniformDensityFilter.is_filled), or once time_budget seconds have passed.
+        seen_range_only - only require the segments between the darkest and brightest chars found so far to be filled.
+        patience - the range counts as settled once it spans more than one segment and either reaches the segment of DENSE_PROBE_CHAR, or it has not changed while patience more candidates were visited (a quarter of include by default), so that segments which haven't been reached yet aren't mistaken for segments that can't be filled.
+        """
+        startTime = time.perf_counter()
+        densityFilter = UniformDensityFilter((lambda inputElem: inputElem.relative_luminosity), max_segment_count)
+        probeSegIndex = self._get_dense_probe_seg_index(max_segment_count) if seen_range_only else None
+        # for dark text on a light background, the densest char is at the dark end of the range.
+        probeIsDarkest = get_color_luminosity_int(self._background) > get_color_luminosity_int(self._color)
+        candidates = list(Characters.gen_stratified(include, stratum_size=stratum_size))
+        if patience is None:
+            patience = len(candidates)//4
+        visitedCount = 0
+        def genCountedCandidates():
+            nonlocal visitedCount
+            for char in candidates:
+                visitedCount += 1
+                yield char
+        elemGen = self.gen_elements(include=genCountedCandidates(), **other_kwargs)
+        unpublishedCount = 0
+        stableRange, stableSinceCount = None, 0
+        for elem in elemGen:
+            densityFilter.add(elem)
+            unpublishedCount += 1
+            filledRange = densityFilter.get_filled_range()
+            if filledRange != stableRange:
+                stableRange, stableSinceCount = filledRange, visitedCount
+            rangeReachesProbe = probeSegIndex is not None and ((filledRange[0] <= probeSegIndex) if probeIsDarkest else (filledRange[1] >= probeSegIndex))
+            rangeIsSettled = (not seen_range_only) or (filledRange[0] < filledRange[1] and (rangeReachesProbe or visitedCount - stableSinceCount >= patience))
+            if (rangeIsSettled and densityFilter.is_filled(tolerance, seen_range_only=seen_range_only)) or (time_budget is not None and time.perf_counter() - startTime >= time_budget):
+                break
+            if unpublishedCount >= batch_size:
+                yield select_alphabet_elements(densityFilter.get_values())
+                unpublishedCount = 0
+        if unpublishedCount > 0 or densityFilter.item_count == 0:
+            yield select_alphabet_elements(densityFilter.get_values())
+            
+            
+    def _exact_element(self, elem, absolute_luminosity=None) -> TextElement:
+        if absolute_luminosity is None:
+            absolute_luminosity = get_surface_absolute_luminosity_int(elem.image)
+        area = elem.image_width*elem.image_height
+        return elem._replace(
+            absolute_luminosity=absolute_luminosity,
+            relative_luminosity=luminosity_int_to_float(float(absolute_luminosity)/float(area)),
+            coverage=get_coverage_float(absolute_luminosity, area, self._color, self._background),
+        )
+        
+        
+    def get_adaptive_alphabet_elements(self, max_segment_count=None, sample_count=256, confidence_z=4.0, reject_notdef=True, **other_kwargs) -> List[TextElement]:
+        """
+        A version of get_alphabet_elements for large font sizes and coarse segment counts, which estimates each character's luminosity from a sample of at least sample_count pixels (see Colors.estimate_absolute_luminosity_int_from_sample), and only sums every pixel of the characters that could change which characters are selected, and of the selected characters themselves. Estimates are refined in stages, by halving the stride of the sample until it holds every pixel. Each stage only reads the pixels that the previous stages didn't.
+        An estimate is refined when it could fall in another segment, or when it could change whether a challenger beats the current winner of a segment (see UniformDensityFilter.add).
+        This only reads fewer pixels than get_alphabet_elements when max_segment_count is small (around 4): the sampling error of a glyph is about as wide as a segment of 8 or more, and without max_segment_count every character is selected.
+        The result is the same as get_alphabet_elements as long as the statistical error bounds hold. Pixel counts are stored in self.adaptive_stats.
+        """
+        stats = {"pixels_total":0, "pixels_read":0, "estimated_count":0, "resampled_count":0, "exact_count":0}
+        self.adaptive_stats = stats
+        sampleByChar, strideByChar, boundsByChar = dict(), dict(), dict()
+        
+        def charToEstimatedElement(char):
+            # rendered the same way as in char_to_element, so that both methods see the same chars.
+            picture = self.font.render_element_image(char)
+            area = picture.get_width() * picture.get_height()
+            stride = get_sampling_stride(picture, sample_count)
+            sample = sample_surface_luminosity_ints(picture, stride)
+            absoluteLuminosity, bound = estimate_absolute_luminosity_int_from_sample(sample, area, confidence_z=confidence_z)
+            result = TextElement(self._name, self._size, self._antialias, char, picture, picture.get_width(), picture.get_height(), absoluteLuminosity, luminosity_int_to_float(absoluteLuminosity/float(area)), None)
+            if reject_notdef and self.is_notdef_element(result, luminosity_bound=bound):
+                raise NotdefCharError("matches the .notdef glyph.")
+            stats["pixels_total"] += area
+            stats["pixels_read"] += len(sample)
+            stats["estimated_count"] += 1
+            if bound == 0:
+                result = self._exact_element(result, absolute_luminosity=absoluteLuminosity)
+                stats["exact_count"] += 1
+            sampleByChar[char], strideByChar[char], boundsByChar[char] = sample, stride, (absoluteLuminosity - bound, absoluteLuminosity + bound)
+            return result
+            
+        elements = list(self.gen_elements(reject_notdef=False, element_fun=charToEstimatedElement, **other_kwargs))
+        samples = [sampleByChar[elem.text] for elem in elements]
+        strides = [strideByChar[elem.text] for elem in elements]
+        bounds = [boundsByChar[elem.text] for elem in elements]
+        
+        def isExact(elemIndex):
+            return bounds[elemIndex][0] == bounds[elemIndex][1]
+            
+        def refine(elemIndex):
+            # halves the stride of the element's sample, which holds every pixel once the stride reaches 1. returns False if the element was already exact.
+            elem = elements[elemIndex]
+            if isExact(elemIndex):
+                return False
+            area = elem.image_width * elem.image_height
+            newSample = sample_surface_luminosity_ints(elem.image, strides[elemIndex]//2, coarser_stride=strides[elemIndex])
+            samples[elemIndex] = samples[elemIndex] + newSample
+            strides[elemIndex] //= 2
+            absoluteLuminosity, bound = estimate_absolute_luminosity_int_from_sample(samples[elemIndex], area, confidence_z=confidence_z)
+            bounds[elemIndex] = (absoluteLuminosity - bound, absoluteLuminosity + bound)
+            stats["pixels_read"] += len(newSample)
+            if bound == 0:
+                elements[elemIndex] = self._exact_element(elem, absolute_luminosity=absoluteLuminosity)
+                stats["exact_count"] += 1
+            else:
+                elements[elemIndex] = elem._replace(absolute_luminosity=absoluteLuminosity, relative_luminosity=luminosity_int_to_float(absoluteLuminosity/float(area)))
+                stats["resampled_count"] += 1
+            return True
+            
+        def getKeyBounds(elemIndex):
+            area = elements[elemIndex].image_width * elements[elemIndex].image_height
+            return tuple(luminosity_int_to_float(float(bound)/float(area)) for bound in bounds[elemIndex])
+            
+        def refineWidest(elemIndices):
+            # refines the least certain of the elements, one stage at a time.
+            inexactIndices = [elemIndex for elemIndex in elemIndices if elemIndex is not None and not isExact(elemIndex)]
+            assert len(inexactIndices) > 0, "exact elements should always decide a comparison."
+            return refine(max(inexactIndices, key=(lambda elemIndex: getKeyBounds(elemIndex)[1] - getKeyBounds(elemIndex)[0])))
+            
+        def getSegIndex(relativeLuminosity):
+            return min(int(round(min(max(relativeLuminosity, 0.0), 1.0) * max_segment_count)), max_segment_count-1)
+            
+        selectedIndices = list(range(len(elements)))
         if max_segment_count is not None:
-            result = filtered_for_uniform_density(elemGen, (lambda inputElem: inputElem.relative_luminosity), max_segment_count)
-        else:
-            result = [item for item in elemGen]
+            # replay UniformDensityFilter.add with error bounds, so that only the elements its choices depend on are refined.
+            winnerIndices = [None for segIndex in range(max_segment_count)]
+            for elemIndex in range(len(elements)):
+                while getSegIndex(getKeyBounds(elemIndex)[0]) != getSegIndex(getKeyBounds(elemIndex)[1]):
+                    refine(elemIndex)
+                segIndex = getSegIndex(getKeyBounds(elemIndex)[0])
+                oldIndex = winnerIndices[segIndex]
+                if oldIndex is None:
+                    winnerIndices[segIndex] = elemIndex
+                    continue
+                leftIndex = winnerIndices[segIndex-1] if segIndex-1 >= 0 else None
+                rightIndex = winnerIndices[segIndex+1] if segIndex+1 < max_segment_count else None
+                while True:
+                    leftKeyBounds = getKeyBounds(leftIndex) if leftIndex is not None else (0.0, 0.0)
+                    rightKeyBounds = getKeyBounds(rightIndex) if rightIndex is not None else (1.0, 1.0)
+                    newUniformityBounds = uniformity_score_bounds(leftKeyBounds, getKeyBounds(elemIndex), rightKeyBounds)
+                    oldUniformityBounds = uniformity_score_bounds(leftKeyBounds, getKeyBounds(oldIndex), rightKeyBounds)
+                    if newUniformityBounds[0] > oldUniformityBounds[1]:
+                        winnerIndices[segIndex] = elemIndex
+                        break
+                    if newUniformityBounds[1] <= oldUniformityBounds[0]:
+                        break
+                    refineWidest([elemIndex, oldIndex, leftIndex, rightIndex])
+            # in segment order, as filtered_for_uniform_density returns them, since that order breaks ties in the sort below.
+            selectedIndices = [elemIndex for elemIndex in winnerIndices if elemIndex is not None]
             
-        result.sort(key=(lambda item: item.absolute_luminosity))
+        # the selected elements are made exact, so that they have the same luminosity and coverage as in get_alphabet_elements.
+        for elemIndex in selectedIndices:
+            while refine(elemIndex):
+                pass
+        # the sort is stable, as in get_alphabet_elements.
+        selectedIndices.sort(key=(lambda elemIndex: elements[elemIndex].absolute_luminosity))
+        return [elements[elemIndex] for elemIndex in selectedIndices]
+        
+        
+    def get_progressive_alphabet_elements(self, max_segment_count, **kwargs) -> List[TextElement]:
+        result = None
+        for snapshot in self.gen_progressive_alphabet_elements(max_segment_count, **kwargs):
+            result = snapshot
         return result
         
         
-    def get_preview_surface(self, text, width=None, aspect_ratio=2, **column_kwargs) -> pygame.Surface:
-        if len(text) == 0:
-            return pygame.Surface((0,0))
+    def get_themed_alphabet_elements(self, themes, max_segment_count=None, **other_kwargs) -> List[List[TextElement]]:
+        """
+        Create one luminosity alphabet per theme while rendering each character only once.
+        themes - sequence of (color, background) pairs. Since every glyph has only two colors, its luminosity in each theme is computed from its coverage instead of rendering it again.
+        """
+        baseElements = list(self.gen_elements(**other_kwargs))
+        result = []
+        for color, background in themes:
+            themedElements = [recolored_element(elem, color, background) for elem in baseElements]
+            result.append(select_alphabet_elements(themedElements, max_segment_count=max_segment_count))
+        return result
+        
+    def get_themed_alphabet_strs(self, themes, **kwargs):
+        return ["".join(elem.text for elem in themedElements) for themedElements in self.get_themed_alphabet_elements(themes, **kwargs)]
+        
+        
+    def with_size(self, size):
+        return FontProfile(self._name, size, antialias=self._antialias, force_monospace=self._force_monospace, screen_metrics=self._screen_metrics, test_chars=self._test_chars, color=self._color, background=self._background)
+        
+        
+    def get_multisize_estimates(self, sizes, reference_size=None, reject_notdef=True, **other_kwargs) -> Dict[int, List[Tuple[str, float]]]:
+        """
+        Estimate the relative luminosity of every character at each of the given font sizes while rendering each character only once, at reference_size.
+        Each glyph's coverage is scaled by size/reference_size and area-downsampled into the cell it would have at the target size, so differences in cell proportions between sizes are accounted for, but hinting is not.
+        returns a dict from each size to (char, estimated relative luminosity) pairs, sorted by estimate. Use verify_multisize_estimates to measure how good the estimates are.
+        """
+        if numpy is None:
+            raise ImportError("FontProfile.get_multisize_estimates requires the numpy module. Try:\n    pip install numpy")
+        if reference_size is None:
+            reference_size = 4*max(sizes)
+        referenceProfile = self.with_size(reference_size)
+        # the reference glyphs are only used for their pictures, so their luminosity is never summed.
+        elementFun = (lambda char: referenceProfile._char_to_unmeasured_element(char, reject_notdef=reject_notdef))
+        referenceElements = list(referenceProfile.gen_elements(reject_notdef=False, element_fun=elementFun, **other_kwargs))
+        targetFonts = {size: make_pygame_font(self._name, size) for size in sizes}
+        backgroundLuminosity, colorLuminosity = get_color_luminosity_int(self._background), get_color_luminosity_int(self._color)
+        
+        result = {size: [] for size in sizes}
+        # glyphs are grouped by image size, so that each group can be downsampled to every target size in one vectorized step.
+        elemGroups = dict()
+        for elem in referenceElements:
+            elemGroups.setdefault(elem.image.get_size(), []).append(elem)
+        for (groupWidth, groupHeight), groupElements in elemGroups.items():
+            coverageStack = get_coverage_stack([elem.image for elem in groupElements], self._color, self._background)
+            for size, targetFont in targetFonts.items():
+                scale = float(size)/reference_size
+                if isinstance(self.font, MonospaceFont):
+                    cellWidth = targetFont.size(self._test_chars[0])[0]
+                else:
+                    cellWidth = max(1, int(round(groupWidth*scale)))
+                cellHeight = targetFont.get_height()
+                rowWeights, columnWeights = get_area_weights(groupHeight, cellHeight, scale), get_area_weights(groupWidth, cellWidth, scale)
+                meanCoverages = numpy.einsum("h,nhw,w->n", rowWeights, coverageStack, columnWeights) / (cellWidth*cellHeight)
+                for elem, meanCoverage in zip(groupElements, meanCoverages):
+                    result[size].append((elem.text, luminosity_int_to_float(backgroundLuminosity + float(meanCoverage)*(colorLuminosity-backgroundLuminosity))))
+        for size in sizes:
+            result[size].sort(key=(lambda pair: pair[1]))
+        return result
+        
+        
+    def verify_multisize_estimates(self, estimates, sample_size=64, seed=0) -> Dict[int, dict]:
+        """
+        re-renders a random sample of the characters in estimates (the output of get_multisize_estimates) at their real sizes, and compares the estimated order of the sample with the real order.
+        returns a dict from each size to the Characters.compare_alphabets result for the sample, plus "sample_size" and "mean_absolute_error", the mean difference between estimated and real relative luminosity.
+        """
+        randomGen = random.Random(seed)
+        result = dict()
+        for size, estimatePairs in estimates.items():
+            realProfile = self.with_size(size)
+            samplePairs = randomGen.sample(estimatePairs, min(sample_size, len(estimatePairs)))
+            realTriples = []
+            for char, estimate in samplePairs:
+                try:
+                    realTriples.append((char, estimate, realProfile.char_to_element(char).relative_luminosity))
+                except UnusableCharError:
+                    continue # the char is not monospace at this size.
+            estimatedOrder = "".join(char for char, estimate, real in sorted(realTriples, key=(lambda triple: triple[1])))
+            realOrder = "".join(char for char, estimate, real in sorted(realTriples, key=(lambda triple: triple[2])))
+            report = Characters.compare_alphabets(estimatedOrder, realOrder)
+            report["sample_size"] = len(realTriples)
+            report["mean_absolute_error"] = (sum(abs(estimate-real) for char, estimate, real in realTriples)/len(realTriples) if len(realTriples) > 0 else 0.0)
+            result[size] = report
+        return result
+        
+        
+    def get_preview_columns(self, text, width=None, aspect_ratio=2, **column_kwargs) -> List[str]:
         assert isinstance(text, str)
+        assert len(text) > 0
         if width is None:
             lineLength = int((len(text)**0.5)*aspect_ratio)
         else:
@@ -441,7 +966,13 @@ class FontProfile:
         assert (lineCount-1)*lineLength < len(text)
         #print("{} x {}.".format(lineLength, lineCount))
         
-        wrapColumns = columnize_text(text, line_length=lineLength, **column_kwargs)
+        return columnize_text(text, line_length=lineLength, **column_kwargs)
+        
+        
+    def get_preview_surface(self, text, width=None, aspect_ratio=2, **column_kwargs) -> pygame.Surface:
+        if len(text) == 0:
+            return pygame.Surface((0,0))
+        wrapColumns = self.get_preview_columns(text, width=width, aspect_ratio=aspect_ratio, **column_kwargs)
         
         wrapColumnSurfaces = [self.render_lines(wrapColumn) for wrapColumn in wrapColumns]
         result = Graphics.join_surfaces_horizontally(wrapColumnSurfaces)
@@ -449,6 +980,100 @@ class FontProfile:
         return result
             
     
+    def measure_line_width(self, text) -> int:
+        """
+        the width of self.render_line(text), found without rendering.
+        """
+        if isinstance(self.font, MonospaceFont):
+            return len(text) * self.font.monospace_width # unusable chars are replaced by error chars of the same width.
+        try:
+            return sum(self.font.pygame_font.size(char)[0] for char in text)
+        except (pygame.error, ValueError):
+            return self.render_line(text).get_width()
+        
+        
+    def measure_line_height(self, text) -> int:
+        """
+        the height of self.render_line(text), found without rendering when every char can be measured.
+        """
+        try:
+            return self.font.pygame_font.size(text)[1]
+        except (pygame.error, ValueError):
+            # such as null chars and lone surrogates, which render_line replaces with error chars.
+            return self.render_line(text).get_height()
+        
+        
+    def get_preview_layout(self, text, **preview_kwargs):
+        """
+        measures the preview of text without rendering it. returns (wrapColumns as lists of lines, column widths, line height), where the line height is the tallest line's, so that no line overlaps the next.
+        """
+        wrapColumns = [wrapColumn.split("\n") for wrapColumn in self.get_preview_columns(text, **preview_kwargs)]
+        columnWidths = [max(self.measure_line_width(line) for line in wrapColumn) for wrapColumn in wrapColumns]
+        lineHeight = max(self.measure_line_height(line) for wrapColumn in wrapColumns for line in wrapColumn)
+        return (wrapColumns, columnWidths, lineHeight)
+        
+        
+    def gen_preview_tile_rows(self, text, tile_size=(1024, 1024), layout=None, **preview_kwargs) -> Iterator[pygame.Surface]:
+        """
+        yields the preview of text as horizontal strips, each of the full preview width and at most tile_size[1] pixels tall (but at least one line tall). Only one strip is rendered at a time.
+        the layout matches get_preview_surface, except that every line is given the same height.
+        layout - the result of get_preview_layout, if it is already known.
+        """
+        if layout is None:
+            layout = self.get_preview_layout(text, **preview_kwargs)
+        wrapColumns, columnWidths, lineHeight = layout
+        totalLineCount = max(len(wrapColumn) for wrapColumn in wrapColumns)
+        tileLineCount = max(1, tile_size[1] // lineHeight)
+        
+        for tileStartLine in range(0, totalLineCount, tileLineCount):
+            tileEndLine = min(tileStartLine+tileLineCount, totalLineCount)
+            tileRowSurface = pygame.Surface((sum(columnWidths), (tileEndLine-tileStartLine)*lineHeight), flags=pygame.SRCALPHA)
+            x = 0
+            for wrapColumn, columnWidth in zip(wrapColumns, columnWidths):
+                for lineIndex, line in enumerate(wrapColumn[tileStartLine:tileEndLine]):
+                    if len(line) > 0:
+                        tileRowSurface.blit(self.render_line(line), (x, lineIndex*lineHeight))
+                x += columnWidth
+            yield tileRowSurface
+            
+            
+    def export_preview(self, text, path, tiled=False, tile_size=(1024, 1024), **preview_kwargs):
+        """
+        save the preview of text without ever holding more than one row of tiles in memory.
+        tiled - if False, path is a PNG file, written one strip at a time. If True, path is a directory that receives tile_<row>_<column>.png files no larger than tile_size, and an index.json describing where each tile belongs.
+        preview_kwargs - width, aspect_ratio, and columnize_text options such as column_width, column_header, and column_line_format.
+        """
+        if len(text) == 0:
+            print("no text to export.")
+            return
+        # the first pass only measures, so that the full size is known before any pixels are written.
+        layout = self.get_preview_layout(text, **preview_kwargs)
+        wrapColumns, columnWidths, lineHeight = layout
+        totalWidth = sum(columnWidths)
+        totalHeight = max(len(wrapColumn) for wrapColumn in wrapColumns) * lineHeight
+        tileRowGen = self.gen_preview_tile_rows(text, tile_size=tile_size, layout=layout)
+        
+        if not tiled:
+            with Graphics.PNGStreamWriter(path, totalWidth, totalHeight) as pngWriter:
+                for tileRowSurface in tileRowGen:
+                    pngWriter.write_surface_rows(tileRowSurface)
+            return
+            
+        directory = path_from_str(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        index = {"width":totalWidth, "height":totalHeight, "tile_width":tile_size[0], "tiles":[]}
+        y = 0
+        for tileRowIndex, tileRowSurface in enumerate(tileRowGen):
+            for tileColumnIndex, x in enumerate(range(0, totalWidth, tile_size[0])):
+                tileRect = pygame.Rect(x, 0, min(tile_size[0], totalWidth-x), tileRowSurface.get_height())
+                tileFileName = "tile_{}_{}.png".format(tileRowIndex, tileColumnIndex)
+                pygame.image.save(tileRowSurface.subsurface(tileRect), str(directory / tileFileName))
+                index["tiles"].append({"row":tileRowIndex, "column":tileColumnIndex, "x":x, "y":y, "width":tileRect.width, "height":tileRect.height, "file":tileFileName})
+            y += tileRowSurface.get_height()
+        with open(directory / "index.json", "w") as indexFile:
+            json.dump(index, indexFile, indent=1)
+        
+        
     def preview(self, text, **kwargs):
         if len(text) == 0:
             print("no text to preview.")
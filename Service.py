@@ -0,0 +1,264 @@
+"""
+
+Service.py: a long-running local alphabet server that keeps FontProfiles and alphabets warm.
+
+The protocol is one JSON object per line, in both directions, over a unix socket or a localhost TCP port. Requests:
+
+    {"op": "alphabet", "font": null, "size": 10, "max_segment_count": 32}
+    {"op": "image_to_text", "size": 10, "image_path": "/path/to/image.png", "columns": 80}
+    {"op": "stats"}
+
+Font keys are "font" (null means DEFAULT_FONT_PATH_STR), "size", "antialias", "color", and "background". Alphabet keys are "max_segment_count", "start" and "stop" (a codepoint range to scan instead of keyboard chars), and "visually_dedupe".
+Responses are {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+
+usage:
+
+    python Service.py serve --unix /tmp/pla.sock
+    python Service.py load --unix /tmp/pla.sock --size 10 --count 1000 --concurrency 16
+
+"""
+
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import json
+import os
+import time
+
+import numpy
+import pygame
+
+import Characters
+import PyLuminosityAlphabet as pla
+import Terminal
+
+
+
+def parse_profile_key(message):
+    # (font, size, antialias, color, background)
+    font = message.get("font")
+    return (
+        pla.DEFAULT_FONT_PATH_STR if font is None else font,
+        int(message["size"]),
+        bool(message.get("antialias", True)),
+        tuple(message.get("color", (255,255,255))),
+        tuple(message.get("background", (0,0,0))),
+    )
+
+
+def parse_alphabet_key(message):
+    if (message.get("start") is None) != (message.get("stop") is None):
+        raise ValueError("\"start\" and \"stop\" must be given together.")
+    return (message.get("max_segment_count"), message.get("start"), message.get("stop"), bool(message.get("visually_dedupe", False)))
+
+
+
+
+# these functions run in the worker processes, each of which keeps its own warm FontProfiles.
+
+@functools.lru_cache(maxsize=16)
+def _worker_get_font_profile(profile_key):
+    font, size, antialias, color, background = profile_key
+    return pla.FontProfile(font, size, antialias=antialias, color=color, background=background)
+
+
+def _worker_compute_alphabet(profile_key, alphabet_key):
+    fontProfile = _worker_get_font_profile(profile_key)
+    maxSegmentCount, start, stop, visuallyDedupe = alphabet_key
+    include = Characters.KEYBOARD_CHARS if start is None else [chr(charCode) for charCode in range(start, stop)]
+    return fontProfile.get_alphabet_str(max_segment_count=maxSegmentCount, include=include, visually_dedupe=visuallyDedupe)
+
+
+def _worker_image_to_text(profile_key, alphabet, image_path, columns):
+    fontProfile = _worker_get_font_profile(profile_key)
+    cellWidth, cellHeight = fontProfile.render_char(alphabet[0]).get_size()
+    image = pygame.image.load(image_path)
+    if image.get_bitsize() < 24:
+        # smoothscale only accepts 24 and 32 bit surfaces.
+        converted = pygame.Surface(image.get_size(), depth=32)
+        converted.blit(image, (0, 0))
+        image = converted
+    rows = max(1, int(round(columns * image.get_height() * cellWidth / (image.get_width() * cellHeight))))
+    scaled = pygame.transform.smoothscale(image, (columns, rows))
+    values = pygame.surfarray.array3d(scaled).sum(axis=2).T / 765.0
+    charArray = Terminal.luminosity_array_to_char_array(values, alphabet)
+    return "\n".join("".join(row) for row in charArray)
+
+
+
+
+class AlphabetService:
+    def __init__(self, cache_size=64, max_workers=None):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._in_flight = dict()
+        self._pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.stats = {"requests":0, "errors":0, "cache_hits":0, "coalesced":0, "computations":0, "total_latency_seconds":0.0}
+
+
+    async def _get_cached(self, key, compute_fun, *args):
+        """
+        returns the cached value for key, or computes it in the worker pool. Concurrent requests for the same key share one computation.
+        """
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return self._cache[key]
+        if key in self._in_flight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._in_flight[key])
+        future = asyncio.get_running_loop().run_in_executor(self._pool, compute_fun, *args)
+        self._in_flight[key] = future
+        self.stats["computations"] += 1
+        future.add_done_callback(functools.partial(self._finish_computation, key))
+        # shielded, so that if this request is cancelled, the requests sharing the computation still get its result.
+        return await asyncio.shield(future)
+        
+        
+    def _finish_computation(self, key, future):
+        # runs when the computation ends, even if the request that started it was cancelled.
+        del self._in_flight[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._cache[key] = future.result()
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+    async def get_alphabet(self, profile_key, alphabet_key):
+        return await self._get_cached(("alphabet", profile_key, alphabet_key), _worker_compute_alphabet, profile_key, alphabet_key)
+
+
+    async def image_to_text(self, profile_key, alphabet_key, image_path, columns):
+        alphabet = await self.get_alphabet(profile_key, alphabet_key)
+        if len(alphabet) == 0:
+            raise ValueError("the alphabet is empty.")
+        # the file's modification time and size are part of the key, so that a changed image is not answered from the cache.
+        imageStat = os.stat(image_path)
+        imageKey = (image_path, imageStat.st_mtime_ns, imageStat.st_size)
+        return await self._get_cached(("image_to_text", profile_key, alphabet_key, imageKey, columns), _worker_image_to_text, profile_key, alphabet, image_path, columns)
+
+
+    async def handle_message(self, message):
+        op = message.get("op")
+        if op == "alphabet":
+            return await self.get_alphabet(parse_profile_key(message), parse_alphabet_key(message))
+        elif op == "image_to_text":
+            return await self.image_to_text(parse_profile_key(message), parse_alphabet_key(message), message["image_path"], int(message.get("columns", 80)))
+        elif op == "stats":
+            return dict(self.stats, cache_entries=len(self._cache))
+        else:
+            raise ValueError("unknown op {!r}.".format(op))
+
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                startTime = time.perf_counter()
+                self.stats["requests"] += 1
+                try:
+                    response = {"ok":True, "result":(await self.handle_message(json.loads(line)))}
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    response = {"ok":False, "error":"{}: {}".format(type(e).__name__, e)}
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+                self.stats["total_latency_seconds"] += time.perf_counter() - startTime
+        finally:
+            writer.close()
+
+
+    async def serve(self, unix_path=None, host="127.0.0.1", port=8765):
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+        print("serving on {}.".format(unix_path if unix_path is not None else "{}:{}".format(host, port)))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown()
+
+
+
+
+async def open_connection(unix_path=None, host="127.0.0.1", port=8765):
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(path=unix_path)
+    return await asyncio.open_connection(host=host, port=port)
+
+
+async def send_request(reader, writer, message):
+    writer.write((json.dumps(message) + "\n").encode("utf-8"))
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response["result"]
+
+
+async def run_load(message, count, concurrency, **connection_kwargs):
+    """
+    sends message count times over concurrency connections, and reports latency and throughput.
+    """
+    latencies = []
+    async def runClient(clientCount):
+        reader, writer = await open_connection(**connection_kwargs)
+        try:
+            for i in range(clientCount):
+                startTime = time.perf_counter()
+                await send_request(reader, writer, message)
+                latencies.append(time.perf_counter() - startTime)
+        finally:
+            writer.close()
+    clientCounts = [count//concurrency + (1 if i < count%concurrency else 0) for i in range(concurrency)]
+    startTime = time.perf_counter()
+    await asyncio.gather(*[runClient(clientCount) for clientCount in clientCounts])
+    elapsed = time.perf_counter() - startTime
+    latencyArray = numpy.array(latencies)*1000.0
+    return {
+        "requests": len(latencies),
+        "elapsed_seconds": elapsed,
+        "requests_per_second": len(latencies)/elapsed,
+        "latency_ms_p50": float(numpy.percentile(latencyArray, 50)),
+        "latency_ms_p95": float(numpy.percentile(latencyArray, 95)),
+        "latency_ms_p99": float(numpy.percentile(latencyArray, 99)),
+        "latency_ms_max": float(latencyArray.max()),
+    }
+
+
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="local alphabet service.")
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--unix", default=None, help="unix socket path. If omitted, localhost TCP is used.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--font", default=None)
+    parser.add_argument("--size", type=int, default=10)
+    parser.add_argument("--max-segment-count", type=int, default=None)
+    parser.add_argument("--image", default=None, help="load test image_to_text with this image instead of alphabet.")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parsed = parser.parse_args(args)
+
+    connectionKwargs = {"unix_path":parsed.unix, "port":parsed.port}
+    if parsed.command == "serve":
+        asyncio.run(AlphabetService(cache_size=parsed.cache_size, max_workers=parsed.workers).serve(**connectionKwargs))
+    else:
+        message = {"op":"alphabet", "font":parsed.font, "size":parsed.size, "max_segment_count":parsed.max_segment_count}
+        if parsed.image is not None:
+            message.update(op="image_to_text", image_path=parsed.image)
+        print(json.dumps(asyncio.run(run_load(message, parsed.count, parsed.concurrency, **connectionKwargs)), indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+
+Sharding.py: split a long FontProfile scan across several machines, then merge the partial results.
+
+Every shard scans the same candidate chars, but only processes the chars whose position among them is shard_index modulo shard_count. The merge step restores the original order before deduping, filtering, and sorting, so its output is identical to a single-node run of FontProfile.get_alphabet_str with the same arguments.
+
+usage:
+
+    python Sharding.py scan --size 10 --start 0 --stop 65536 --shard 0/4 shard_0.json
+    ...
+    python Sharding.py scan --size 10 --start 0 --stop 65536 --shard 3/4 shard_3.json
+    python Sharding.py merge --max-segment-count 64 alphabet.txt shard_0.json shard_1.json shard_2.json shard_3.json
+
+"""
+
+import argparse
+from collections import namedtuple
+import hashlib
+import json
+
+import Characters
+import PyLuminosityAlphabet as pla
+
+
+
+SHARD_FORMAT_NAME = "PyLuminosityAlphabet shard"
+SHARD_FORMAT_VERSION = 1
+
+ShardEntry = namedtuple("ShardEntry", ["position", "text", "absolute_luminosity", "relative_luminosity", "digest"])
+
+
+class ShardMergeError(ValueError):
+    pass
+
+
+def get_candidates_digest(candidates):
+    return hashlib.sha256("".join(candidates).encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def scan_shard(font_profile, shard_index, shard_count, include=Characters.KEYBOARD_CHARS, exclude=Characters.SPECIAL_CHAR_SET, visually_dedupe=False):
+    """
+    returns a dict holding a manifest and the compact entries for shard shard_index of shard_count.
+    """
+    candidates = list(pla.iter_include_exclude(include, exclude))
+    manifest = {
+        "format": SHARD_FORMAT_NAME,
+        "version": SHARD_FORMAT_VERSION,
+        "font_profile": repr(font_profile),
+        "candidates_digest": get_candidates_digest(candidates),
+        "candidate_count": len(candidates),
+        "visually_dedupe": visually_dedupe,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+    }
+    entries = []
+    for position, elem in font_profile._gen_positioned_elements(include=candidates, exclude=set(), shard_index=shard_index, shard_count=shard_count):
+        digest = pla.surface_digest(elem.image) if visually_dedupe else None
+        entries.append([position, ord(elem.text), elem.absolute_luminosity, elem.relative_luminosity, digest])
+    return {"manifest": manifest, "entries": entries}
+
+
+def write_shard(path, font_profile, shard_index, shard_count, **scan_kwargs):
+    shardData = scan_shard(font_profile, shard_index, shard_count, **scan_kwargs)
+    with open(path, "w") as outFile:
+        json.dump(shardData, outFile, separators=(",", ":"))
+    return shardData["manifest"]
+
+
+def read_shard(path):
+    with open(path, "r") as inFile:
+        shardData = json.load(inFile)
+    manifest = shardData["manifest"]
+    if manifest.get("format") != SHARD_FORMAT_NAME or manifest.get("version") != SHARD_FORMAT_VERSION:
+        raise ShardMergeError("{} is not a version {} shard file.".format(path, SHARD_FORMAT_VERSION))
+    return shardData
+
+
+def validated_manifests(manifests):
+    if len(manifests) == 0:
+        raise ShardMergeError("no shards to merge.")
+    sharedKeys = [key for key in manifests[0].keys() if key != "shard_index"]
+    for manifest in manifests[1:]:
+        for key in sharedKeys:
+            if manifest[key] != manifests[0][key]:
+                raise ShardMergeError("shards disagree about {}: {!r} vs {!r}.".format(key, manifests[0][key], manifest[key]))
+    shardCount = manifests[0]["shard_count"]
+    seenIndices = set()
+    for manifest in manifests:
+        if manifest["shard_index"] in seenIndices:
+            raise ShardMergeError("duplicate shard {} of {}.".format(manifest["shard_index"], shardCount))
+        seenIndices.add(manifest["shard_index"])
+    missingIndices = sorted(set(range(shardCount)) - seenIndices)
+    if len(missingIndices) > 0:
+        raise ShardMergeError("missing shards {} of {}.".format(missingIndices, shardCount))
+    return manifests[0]
+
+
+def merge_shard_entries(shard_datas):
+    """
+    returns all ShardEntries of the given shards, in the order a single-node scan would have produced them.
+    """
+    manifest = validated_manifests([shardData["manifest"] for shardData in shard_datas])
+    result = []
+    for shardData in shard_datas:
+        shardIndex = shardData["manifest"]["shard_index"]
+        for position, charCode, absoluteLuminosity, relativeLuminosity, digest in shardData["entries"]:
+            if position % manifest["shard_count"] != shardIndex:
+                raise ShardMergeError("shard {} holds position {}, which belongs to another shard.".format(shardIndex, position))
+            result.append(ShardEntry(position, chr(charCode), absoluteLuminosity, relativeLuminosity, digest))
+    result.sort(key=(lambda entry: entry.position))
+    if manifest["visually_dedupe"]:
+        result = list(pla.gen_deduped(result, key_fun=(lambda entry: entry.digest)))
+    return result
+
+
+def merge_shards(shard_datas, max_segment_count=None):
+    """
+    the sharded equivalent of FontProfile.get_alphabet_str.
+    """
+    entries = merge_shard_entries(shard_datas)
+    if max_segment_count is not None:
+        entries = pla.filtered_for_uniform_density(entries, (lambda entry: entry.relative_luminosity), max_segment_count)
+    entries.sort(key=(lambda entry: entry.absolute_luminosity))
+    return "".join(entry.text for entry in entries)
+
+
+def parse_shard_str(shard_str):
+    shardIndexStr, shardCountStr = shard_str.split("/")
+    return int(shardIndexStr), int(shardCountStr)
+
+
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="sharded FontProfile scans.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scanParser = subparsers.add_parser("scan", help="scan one shard and write its partial result file.")
+    scanParser.add_argument("--font", default=pla.DEFAULT_FONT_PATH_STR)
+    scanParser.add_argument("--size", type=int, required=True)
+    scanParser.add_argument("--no-antialias", action="store_true")
+    scanParser.add_argument("--start", type=int, default=None, help="first codepoint to scan. If omitted, keyboard chars are scanned.")
+    scanParser.add_argument("--stop", type=int, default=None, help="codepoint after the last one to scan. Required with --start.")
+    scanParser.add_argument("--visually-dedupe", action="store_true")
+    scanParser.add_argument("--shard", required=True, help="<shard index>/<shard count>, such as 0/4.")
+    scanParser.add_argument("output_path")
+
+    mergeParser = subparsers.add_parser("merge", help="merge shard files into the final alphabet.")
+    mergeParser.add_argument("--max-segment-count", type=int, default=None)
+    mergeParser.add_argument("output_path")
+    mergeParser.add_argument("shard_paths", nargs="+")
+
+    parsed = parser.parse_args(args)
+    if parsed.command == "scan":
+        if (parsed.start is None) != (parsed.stop is None):
+            scanParser.error("--start and --stop must be given together.")
+        shardIndex, shardCount = parse_shard_str(parsed.shard)
+        fontProfile = pla.FontProfile(parsed.font, parsed.size, antialias=(not parsed.no_antialias))
+        if parsed.start is None:
+            include = Characters.KEYBOARD_CHARS
+        else:
+            include = [chr(charCode) for charCode in range(parsed.start, parsed.stop)]
+        write_shard(parsed.output_path, fontProfile, shardIndex, shardCount, include=include, visually_dedupe=parsed.visually_dedupe)
+        print("wrote shard {} of {} to {}.".format(shardIndex, shardCount, parsed.output_path))
+    else:
+        alphabet = merge_shards([read_shard(path) for path in parsed.shard_paths], max_segment_count=parsed.max_segment_count)
+        with open(parsed.output_path, "w", encoding="utf-8") as outFile:
+            outFile.write(alphabet)
+        print("wrote {} chars to {}.".format(len(alphabet), parsed.output_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+
+Terminal.py: streaming, delta-encoded terminal output for text art drawn with luminosity alphabets.
+
+usage:
+
+    import PyLuminosityAlphabet as pla
+    import Terminal
+
+    fontProfile = pla.FontProfile(<full path of target font>, <font size>)
+    renderer = Terminal.StreamingRenderer.from_font_profile(fontProfile, max_segment_count=32, fps=30)
+    for frame in <2d arrays of floats between 0.0 and 1.0>:
+        renderer.write_luminosity_frame(frame)
+    renderer.close()
+    print(renderer.get_throughput())
+
+"""
+
+import sys
+import time
+
+import numpy
+
+
+
+CSI = "\x1b["
+CURSOR_HIDE = CSI + "?25l"
+CURSOR_SHOW = CSI + "?25h"
+CLEAR_SCREEN = CSI + "2J"
+
+
+def cursor_move_str(row, column):
+    # ANSI cursor positions are 1-based.
+    return CSI + "{};{}H".format(row+1, column+1)
+
+
+def luminosity_array_to_char_array(values, alphabet):
+    """
+    values - 2d array of floats between 0.0 and 1.0.
+    alphabet - sequence of chars sorted from darkest to brightest, such as the output of FontProfile.get_alphabet_chars.
+    """
+    assert len(alphabet) > 0
+    alphabetArray = numpy.array(list(alphabet), dtype="<U1")
+    indices = (numpy.asarray(values, dtype=float) * len(alphabetArray)).astype(int)
+    numpy.clip(indices, 0, len(alphabetArray)-1, out=indices)
+    return alphabetArray[indices]
+
+
+def lines_to_char_array(lines, fill_char=" "):
+    if isinstance(lines, str):
+        lines = lines.split("\n")
+    lines = list(lines)
+    width = max((len(line) for line in lines), default=0)
+    return numpy.array([list(line.ljust(width, fill_char)) for line in lines], dtype="<U1").reshape(len(lines), width)
+
+
+def gen_changed_runs(changed_row, merge_gap=0):
+    """
+    yields (start, stop) pairs for the runs of True in the 1d bool array changed_row.
+    runs separated by merge_gap or fewer unchanged cells are merged, because reprinting a few unchanged chars is cheaper than moving the cursor past them.
+    """
+    padded = numpy.concatenate(([False], changed_row, [False])).astype(numpy.int8)
+    edges = numpy.flatnonzero(numpy.diff(padded))
+    starts, stops = edges[0::2], edges[1::2]
+    if len(starts) == 0:
+        return
+    runStart, runStop = int(starts[0]), int(stops[0])
+    for start, stop in zip(starts[1:], stops[1:]):
+        if start - runStop <= merge_gap:
+            runStop = int(stop)
+        else:
+            yield (runStart, runStop)
+            runStart, runStop = int(start), int(stop)
+    yield (runStart, runStop)
+
+assert list(gen_changed_runs(numpy.array([True, True, False, False, True, False]))) == [(0,2), (4,5)]
+assert list(gen_changed_runs(numpy.array([True, False, False, True]), merge_gap=2)) == [(0,4)]
+assert list(gen_changed_runs(numpy.array([False, False]))) == []
+
+
+
+
+class StreamingRenderer:
+    """
+    keeps the char grid of the previous frame, and for each new frame writes only the cursor moves and runs of chars that changed.
+    """
+    def __init__(self, alphabet=None, stream=None, fps=None, merge_gap=4, origin=(0,0)):
+        self.alphabet = alphabet
+        self.stream = sys.stdout if stream is None else stream
+        self.frame_interval = None if fps is None else 1.0/fps
+        self.merge_gap = merge_gap
+        self.origin = origin
+        self.previous_grid = None
+        self._next_frame_time = None
+        self._start_time = None
+        self.stats = {"frames":0, "full_redraws":0, "cells_changed":0, "runs":0, "bytes_written":0, "paced_sleep_seconds":0.0}
+
+
+    @classmethod
+    def from_font_profile(cls, font_profile, stream=None, fps=None, merge_gap=4, origin=(0,0), **alphabet_kwargs):
+        return cls(font_profile.get_alphabet_chars(**alphabet_kwargs), stream=stream, fps=fps, merge_gap=merge_gap, origin=origin)
+
+
+    def __repr__(self):
+        return "StreamingRenderer(alphabet={!r}, fps={}, merge_gap={}, origin={})".format(self.alphabet, (None if self.frame_interval is None else 1.0/self.frame_interval), self.merge_gap, self.origin)
+
+
+    def _write(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+        self.stats["bytes_written"] += len(text.encode("utf-8"))
+
+
+    def _pace(self):
+        now = time.perf_counter()
+        if self._start_time is None:
+            self._start_time = now
+        if self.frame_interval is None:
+            return
+        if self._next_frame_time is None:
+            self._next_frame_time = now
+        delay = self._next_frame_time - now
+        if delay > 0:
+            time.sleep(delay)
+            self.stats["paced_sleep_seconds"] += delay
+        else:
+            # running behind, so don't try to catch up by bursting frames.
+            self._next_frame_time = now
+        self._next_frame_time += self.frame_interval
+
+
+    def _full_redraw_str(self, grid):
+        originRow, originColumn = self.origin
+        pieces = [CURSOR_HIDE] + ([CLEAR_SCREEN] if self.previous_grid is not None else [])
+        for rowIndex, row in enumerate(grid):
+            pieces.append(cursor_move_str(originRow+rowIndex, originColumn))
+            pieces.append("".join(row))
+        self.stats["full_redraws"] += 1
+        self.stats["cells_changed"] += grid.size
+        self.stats["runs"] += grid.shape[0]
+        return "".join(pieces)
+
+
+    def _delta_str(self, grid):
+        originRow, originColumn = self.origin
+        changed = (grid != self.previous_grid)
+        pieces = []
+        for rowIndex in numpy.flatnonzero(changed.any(axis=1)):
+            row = grid[rowIndex]
+            for start, stop in gen_changed_runs(changed[rowIndex], merge_gap=self.merge_gap):
+                pieces.append(cursor_move_str(originRow+int(rowIndex), originColumn+start))
+                pieces.append("".join(row[start:stop]))
+                self.stats["runs"] += 1
+        self.stats["cells_changed"] += int(numpy.count_nonzero(changed))
+        return "".join(pieces)
+
+
+    def write_char_frame(self, grid):
+        """
+        grid - 2d array of single chars, or a list of lines.
+        """
+        if not isinstance(grid, numpy.ndarray):
+            grid = lines_to_char_array(grid)
+        assert grid.ndim == 2
+        self._pace()
+        if self.previous_grid is None or self.previous_grid.shape != grid.shape:
+            output = self._full_redraw_str(grid)
+        else:
+            output = self._delta_str(grid)
+        if len(output) > 0:
+            self._write(output)
+        self.previous_grid = grid.copy()
+        self.stats["frames"] += 1
+
+
+    def write_luminosity_frame(self, values):
+        if self.alphabet is None:
+            raise ValueError("an alphabet is needed to write luminosity frames.")
+        self.write_char_frame(luminosity_array_to_char_array(values, self.alphabet))
+
+
+    def close(self):
+        rowCount = 0 if self.previous_grid is None else self.previous_grid.shape[0]
+        self._write(cursor_move_str(self.origin[0]+rowCount, 0) + CURSOR_SHOW)
+
+
+    def get_throughput(self):
+        elapsed = 0.0 if self._start_time is None else time.perf_counter() - self._start_time
+        result = dict(self.stats)
+        result["elapsed_seconds"] = elapsed
+        result["frames_per_second"] = (self.stats["frames"] / elapsed) if elapsed > 0 else 0.0
+        result["bytes_per_second"] = (self.stats["bytes_written"] / elapsed) if elapsed > 0 else 0.0
+        result["bytes_per_frame"] = (self.stats["bytes_written"] / self.stats["frames"]) if self.stats["frames"] > 0 else 0.0
+        return result